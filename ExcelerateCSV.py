@@ -3,22 +3,33 @@
 # Date: 24-11-2024
 
 import os
-import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pacsv
+from pyarrow import compute as pc
+import csv
+import codecs
 from datetime import datetime
 import traceback
-from openpyxl import Workbook
 import gc
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import queue
+import multiprocessing
+import mmap
+import json
+import hashlib
+from xlsxwriter import Workbook
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import psutil  # For system memory stats
 from tqdm import tqdm  # For progress bars
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
 # Global stats dictionary to track processing outcomes
 processing_stats = {
     "total_files": 0,  # Total number of files to process
     "success_count": 0,  # Count of successfully processed files
     "failure_count": 0,  # Count of failed files
+    "skipped_count": 0,  # Count of files skipped because an up-to-date conversion exists
     "time_per_file": {},  # Time taken to process each file
     "errors": {}  # Specific errors encountered for each file
 }
@@ -34,17 +45,158 @@ FILE_PREFIX = "MASKED_PREFIX"  # Prefix to filter files
 
 LOG_FILE_NAME = "script_log.txt"  # Log file name
 
-def get_dynamic_chunk_size():
+MANIFEST_FILE_NAME = ".manifest.json"  # Records converted files so re-runs can skip them
+
+EXCEL_MAX_ROWS = 1048576  # Rows per worksheet in Excel, including the header row
+
+NAN_VALUES = pa.array(['nan', 'NAN', 'NaN'])  # Cell values written to Excel as empty strings
+
+# Cells stored as Excel numbers in numeric columns. Anything float() would alter or reinterpret stays text:
+# leading zeros, '+' signs, exponents, spaces, underscores
+NUMERIC_PATTERN = r'^(0(\.[0-9]+)?|-?[1-9][0-9]*(\.[0-9]+)?|-0\.[0-9]*[1-9][0-9]*)$'  # No leading zeros or negative zero
+MAX_NUMERIC_DIGITS = 15  # Digits a double holds exactly; longer values such as IDs stay text
+MAX_WHOLE_DIGITS = 11  # Longer whole numbers, such as EAN-13 barcodes, would display in scientific notation
+COLUMN_COUNT_ERROR = 'columns, got'  # Part of Arrow's message for a row with the wrong number of fields
+
+# XlsxWriter options shared by every workbook a worker writes:
+# constant_memory flushes each row to disk as soon as the next one starts;
+# strings_to_urls is off because Excel caps hyperlinks per sheet and by length, and refused links drop the cell
+WORKBOOK_OPTIONS = {'constant_memory': True, 'strings_to_urls': False}
+
+def get_dynamic_chunk_size(memory_info):
     """
     Dynamically calculates an optimal chunk size based on available system memory.
     Ensures the program can handle large files efficiently without consuming too much memory.
 
+    Args:
+        memory_info (psutil._common.svmem): A psutil.virtual_memory() snapshot taken once at startup.
+
     Returns:
         int: The calculated chunk size.
     """
-    available_memory = psutil.virtual_memory().available / (1024 ** 2)  # MB
+    available_memory = memory_info.available / (1024 ** 2)  # MB
     return max(1000, int(available_memory // 15))  # Use ~7% of available memory
 
+def get_windows_storage_type(drive):
+    """
+    Determines the kind of storage behind a Windows drive letter.
+    Fixed drives are told apart by whether the volume reports a seek penalty, which only spinning disks do.
+
+    Args:
+        drive (str): The drive, such as 'C:'.
+
+    Returns:
+        str: 'network', 'hdd' or 'ssd'. Defaults to 'ssd' when the volume cannot be queried.
+    """
+    import ctypes
+    from ctypes import wintypes
+
+    class STORAGE_PROPERTY_QUERY(ctypes.Structure):
+        _fields_ = [('PropertyId', wintypes.DWORD), ('QueryType', wintypes.DWORD), ('AdditionalParameters', wintypes.BYTE * 1)]
+
+    class DEVICE_SEEK_PENALTY_DESCRIPTOR(ctypes.Structure):
+        _fields_ = [('Version', wintypes.DWORD), ('Size', wintypes.DWORD), ('IncursSeekPenalty', wintypes.BOOLEAN)]
+
+    kernel32 = ctypes.WinDLL('kernel32')  # A private instance, so the restype below stays local
+    if kernel32.GetDriveTypeW(drive + '\\') == 4:  # DRIVE_REMOTE
+        return 'network'
+
+    # Opening the volume without access rights is enough to query it and needs no elevation
+    kernel32.CreateFileW.restype = wintypes.HANDLE
+    handle = kernel32.CreateFileW(f'\\\\.\\{drive}', 0, 3, None, 3, 0, None)  # FILE_SHARE_READ | FILE_SHARE_WRITE, OPEN_EXISTING
+    if handle in (None, wintypes.HANDLE(-1).value):
+        return 'ssd'
+    query = STORAGE_PROPERTY_QUERY(7, 0)  # StorageDeviceSeekPenaltyProperty, PropertyStandardQuery
+    descriptor = DEVICE_SEEK_PENALTY_DESCRIPTOR()
+    returned = wintypes.DWORD()
+    try:
+        ok = kernel32.DeviceIoControl(
+            wintypes.HANDLE(handle), 0x2D1400,  # IOCTL_STORAGE_QUERY_PROPERTY
+            ctypes.byref(query), ctypes.sizeof(query),
+            ctypes.byref(descriptor), ctypes.sizeof(descriptor),
+            ctypes.byref(returned), None
+        )
+    finally:
+        kernel32.CloseHandle(wintypes.HANDLE(handle))
+    return 'hdd' if ok and descriptor.IncursSeekPenalty else 'ssd'
+
+def get_storage_type(path):
+    """
+    Determines the kind of storage a path lives on.
+
+    Args:
+        path (str): A file or directory path.
+
+    Returns:
+        str: 'network', 'hdd' or 'ssd'. Defaults to 'ssd' when the type cannot be detected.
+    """
+    path = os.path.abspath(path)
+    if path.startswith('\\\\'):
+        return 'network'  # UNC share
+    try:
+        if os.name == 'nt':
+            return get_windows_storage_type(os.path.splitdrive(path)[0])
+
+        # Pick the partition with the longest mount point containing the path
+        partition = max(
+            (p for p in psutil.disk_partitions(all=True) if path == p.mountpoint or path.startswith(p.mountpoint.rstrip(os.sep) + os.sep)),
+            key=lambda p: len(p.mountpoint),
+            default=None
+        )
+        if partition is None:
+            return 'ssd'
+        if partition.fstype.split('.')[-1] in ('nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', 'sshfs'):
+            return 'network'
+
+        # Partitions have no queue of their own, so fall back to the parent block device
+        device = os.path.realpath(os.path.join('/sys/class/block', os.path.basename(partition.device)))
+        for queue_dir in (device, os.path.dirname(device)):
+            rotational = os.path.join(queue_dir, 'queue', 'rotational')
+            if os.path.exists(rotational):
+                with open(rotational) as file:
+                    return 'hdd' if file.read().strip() == '1' else 'ssd'
+    except Exception as e:
+        log_message(f"Could not detect storage type for {path}: {e}")
+    return 'ssd'
+
+def get_max_workers(storage_type):
+    """
+    Chooses the number of worker processes based on the storage the CSV files are read from.
+    Spinning disks thrash under many parallel readers and network shares have limited connections.
+
+    Args:
+        storage_type (str): The storage type returned by get_storage_type.
+
+    Returns:
+        int: The number of worker processes to use.
+    """
+    cpu_count = os.cpu_count() or 1
+    if storage_type == 'hdd':
+        return min(2, cpu_count)
+    if storage_type == 'network':
+        return min(8, cpu_count)
+    return cpu_count
+
+def prefetch_files(csv_files, slots):
+    """
+    Reads files ahead of the worker processes so their bytes are already in the OS page cache.
+
+    Args:
+        csv_files (list): The files in the order they are submitted to the pool.
+        slots (threading.Semaphore): Released once per finished file to bound how far ahead prefetching runs.
+    """
+    for file_path in csv_files:
+        slots.acquire()
+        try:
+            with open(file_path, 'rb') as file:
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)  # Kernel reads ahead asynchronously
+                else:
+                    while file.read(1024 * 1024):
+                        pass
+        except OSError:
+            pass  # Prefetching is best effort; the worker reports real I/O errors
+
 def setup_logging(output_dir):
     """
     Sets up logging with rotating file handlers to ensure logs are maintained efficiently.
@@ -54,7 +206,7 @@ def setup_logging(output_dir):
     """
     log_file = os.path.join(output_dir, LOG_FILE_NAME)
     handler = RotatingFileHandler(log_file, maxBytes=10 * 1024 * 1024, backupCount=5)  # 10 MB max, 5 backups
-    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S")  # No milliseconds
     handler.setFormatter(formatter)
     logging.basicConfig(
         level=logging.INFO,
@@ -62,6 +214,20 @@ def setup_logging(output_dir):
     )
     logging.info("Logging initialized.")
 
+def setup_worker_logging(log_queue):
+    """
+    Routes logging in a worker process through a queue to the parent's handlers,
+    so only the parent process ever writes to (and rotates) the log file.
+
+    Args:
+        log_queue (multiprocessing.Queue): The queue drained by the parent's QueueListener.
+    """
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:  # Drop handlers inherited from a forked parent
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(QueueHandler(log_queue))
+    root_logger.setLevel(logging.INFO)
+
 def log_message(message):
     """
     Logs a message to both the console and the log file.
@@ -86,67 +252,309 @@ def create_output_directory(base_dir):
         os.makedirs(output_dir)
     return output_dir
 
-def validate_csv_file(file_path, delimiter):
+def open_csv_reader(file_path, delimiter, columns, block_size=None):
+    """
+    Opens a streaming Arrow reader that keeps every column as a string.
+
+    Args:
+        file_path (str): The path to the CSV file.
+        delimiter (str): The delimiter used in the file.
+        columns (list): The column names read from the header.
+        block_size (int): Bytes parsed per batch, or None for Arrow's default.
+
+    Returns:
+        pyarrow.csv.CSVStreamingReader: The reader.
+    """
+    read_options = pacsv.ReadOptions()
+    if block_size is not None:
+        read_options.block_size = block_size
+    return pacsv.open_csv(
+        file_path,
+        read_options=read_options,
+        # Quoted values may span lines; without this Arrow loses sync at block boundaries
+        parse_options=pacsv.ParseOptions(delimiter=delimiter, newlines_in_values=True),
+        # Columns stay strings so no block can fail type inference
+        convert_options=pacsv.ConvertOptions(column_types={column: pa.string() for column in columns})
+    )
+
+def read_padded_batches(file_path, delimiter, columns, batch_rows):
+    """
+    Reads a CSV file with the csv module, padding rows that have too few fields with empty cells.
+    Arrow rejects such rows outright, so conversion falls back to this slower reader when it meets one.
+
+    Args:
+        file_path (str): The path to the CSV file.
+        delimiter (str): The delimiter used in the file.
+        columns (list): The column names read from the header.
+        batch_rows (int): The number of rows per batch.
+
+    Yields:
+        pyarrow.RecordBatch: String batches with the same layout as the Arrow reader's.
+
+    Raises:
+        ValueError: If a row has more fields than the header.
+    """
+    schema = pa.schema([(column, pa.string()) for column in columns])
+    width = len(columns)
+    with open(file_path, newline='', encoding='utf-8-sig') as file:
+        reader = csv.reader(file, delimiter=delimiter)
+        for row in reader:
+            if row:
+                break  # Header
+        rows = []
+        for row in reader:
+            if not row:
+                continue  # Blank lines, which Arrow skips as well
+            if len(row) > width:
+                raise ValueError(f"Line {reader.line_num}: Expected {width} columns, got {len(row)}")
+            row.extend([''] * (width - len(row)))
+            rows.append(row)
+            if len(rows) == batch_rows:
+                yield pa.RecordBatch.from_arrays([pa.array(values, pa.string()) for values in zip(*rows)], schema=schema)
+                rows = []
+        if rows:
+            yield pa.RecordBatch.from_arrays([pa.array(values, pa.string()) for values in zip(*rows)], schema=schema)
+
+def probe_csv(file_path, delimiter, columns):
     """
-    Validates the CSV file to ensure it is non-empty and readable.
+    Parses the first block of a CSV file whose header looked suspicious during inspection,
+    and checks that Arrow reads the same header as inspect_csv.
 
     Args:
-        file_path (str): The path to the CSV file to validate.
+        file_path (str): The path to the CSV file.
         delimiter (str): The delimiter used in the file.
+        columns (list): The column names read from the header.
 
     Returns:
-        bool: True if the file is valid, False otherwise.
+        bool: True if the first block parses into string columns named as expected, False otherwise.
     """
     try:
-        df = pd.read_csv(file_path, delimiter=delimiter, nrows=10, dtype=str)
-        if df.empty or df.shape[1] == 0:
-            log_message(f"Validation failed: File {file_path} is empty or has no columns.")
+        reader = open_csv_reader(file_path, delimiter, columns)
+        # A header that does not decode as UTF-8 is read differently by Arrow, so its names are not typed as strings
+        if reader.schema.names != columns or not all(pa.types.is_string(field.type) for field in reader.schema):
+            log_message(f"Validation failed for file {file_path}: header {reader.schema.names} does not match {columns}")
             return False
+        reader.read_next_batch()
         return True
+    except StopIteration:
+        return True  # Header only
+    except pa.ArrowInvalid as e:
+        if COLUMN_COUNT_ERROR in str(e):
+            return True  # Short rows are padded during conversion; long ones still fail there
+        log_message(f"Validation failed for file {file_path}: {e}")
+        return False
     except Exception as e:
         log_message(f"Validation failed for file {file_path}: {e}")
         return False
 
-def determine_delimiter(file_path):
+def inspect_csv(file_path):
     """
-    Determines the delimiter used in the CSV file.
+    Detects the delimiter and reads the header of the CSV file from a read-only memory map.
 
     Args:
         file_path (str): The path to the CSV file.
 
     Returns:
-        str: The detected delimiter (either ',' or ';').
+        tuple: The detected delimiter (either ',' or ';') and the list of column names.
     """
     try:
-        with open(file_path, 'r') as file:
-            first_line = file.readline()
-            if ',' in first_line and ';' not in first_line:
-                return ','
-            elif ';' in first_line and ',' not in first_line:
-                return ';'
-            return ','  # Default to comma
+        # A stat call settles empty files without opening them (they cannot be mapped either)
+        if os.stat(file_path).st_size == 0:
+            return ',', []
+
+        # Scan the mapped bytes in place, so neither decoding nor a copy of the file is needed
+        with open(file_path, 'rb') as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # Skip a byte order mark and any blank lines before the header, as Arrow does
+                start = len(codecs.BOM_UTF8) if mm[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8 else 0
+                while True:
+                    newline = mm.find(b'\n', start)
+                    end = newline if newline >= 0 else len(mm)
+                    if newline < 0 or mm[start:end].rstrip(b'\r'):
+                        break
+                    start = newline + 1
+                first_line = mm[start:end]
+                head = mm[:8192]
+        commas, semicolons = first_line.count(b','), first_line.count(b';')
+        if semicolons > commas:
+            delimiter = ';'
+        elif commas > semicolons or not commas:
+            delimiter = ','  # Default to comma
+        else:
+            # Ambiguous header, let csv.Sniffer look at the whole block
+            try:
+                delimiter = csv.Sniffer().sniff(head.decode('utf-8', errors='replace'), delimiters=',;').delimiter
+            except csv.Error:
+                delimiter = ','
+        columns = next(csv.reader([first_line.decode('utf-8', errors='replace').rstrip('\r')], delimiter=delimiter), [])
+
+        # Only files that do not start as valid UTF-8 text pay for a trial parse. The incremental
+        # decoder tolerates a multibyte character cut off at the end of a truncated block
+        try:
+            codecs.getincrementaldecoder('utf-8')().decode(head, final=len(head) < 8192)
+        except UnicodeDecodeError:
+            if columns and not probe_csv(file_path, delimiter, columns):
+                columns = []
+        return delimiter, columns
     except Exception as e:
-        log_message(f"Error determining delimiter for file {file_path}: {e}")
+        log_message(f"Error inspecting file {file_path}: {e}")
         raise
 
-def retry_on_memory_error(func, retries, *args, **kwargs):
+def numeric_mask(column):
+    """
+    Flags the cells of a string column that can be stored as Excel numbers without changing their value.
+
+    Args:
+        column (pyarrow.StringArray): The column to check.
+
+    Returns:
+        pyarrow.BooleanArray: True for cells matching NUMERIC_PATTERN with at most MAX_NUMERIC_DIGITS digits,
+        or MAX_WHOLE_DIGITS digits for whole numbers.
+    """
+    points = pc.count_substring(column, '.')
+    digits = pc.subtract(pc.utf8_length(column), pc.add(pc.count_substring(column, '-'), points))
+    max_digits = pc.if_else(pc.equal(points, 0), MAX_WHOLE_DIGITS, MAX_NUMERIC_DIGITS)
+    return pc.and_(pc.match_substring_regex(column, NUMERIC_PATTERN), pc.less_equal(digits, max_digits))
+
+def find_numeric_columns(batch):
+    """
+    Decides which columns are numeric from the first batch of a file.
+    A column is numeric when it has at least one non-empty cell and every non-empty cell is numeric.
+
+    Args:
+        batch (pyarrow.RecordBatch): The first batch, with nan markers already blanked out.
+
+    Returns:
+        list: One bool per column.
+    """
+    numeric_columns = []
+    for column in batch.columns:
+        filled = pc.not_equal(column, '')
+        numeric_columns.append(
+            bool(pc.any(filled).as_py()) and bool(pc.all(pc.or_(pc.invert(filled), numeric_mask(column))).as_py())
+        )
+    return numeric_columns
+
+def column_values(column, numeric):
+    """
+    Converts a string column to Python values for writing.
+
+    Args:
+        column (pyarrow.StringArray): The column to convert.
+        numeric (bool): Whether the column is numeric. Cells that are not numeric stay text even then.
+
+    Returns:
+        list: The cell values, with floats for the numeric cells of numeric columns.
     """
-    Retries the specified function in case of a MemoryError, reducing the chunk size dynamically.
+    if not numeric:
+        return column.to_pylist()
+    numbers = pc.cast(pc.if_else(numeric_mask(column), column, pa.scalar(None, pa.string())), pa.float64())
+    return [text if number is None else number for number, text in zip(numbers.to_pylist(), column.to_pylist())]
+
+def write_cells(ws, row_number, row, file_path):
+    """
+    Writes a row cell by cell after write_row reported an error.
+    write_row stops at the first cell it cannot write, so this makes sure the rest of the row is kept.
 
     Args:
-        func (callable): The function to retry.
-        retries (int): The maximum number of retry attempts.
+        ws (xlsxwriter.worksheet.Worksheet): The worksheet being written.
+        row_number (int): The zero-based row to write.
+        row (sequence): The cell values.
+        file_path (str): The CSV file being converted, for log messages.
 
     Raises:
-        MemoryError: If the retry limit is exceeded.
+        ValueError: If a cell cannot be written at all.
+    """
+    for col, value in enumerate(row):
+        error = ws.write(row_number, col, value)
+        if error == -2:
+            log_message(f"Truncated cell in row {row_number + 1}, column {col + 1} of {file_path} to Excel's 32,767 character limit.")
+        elif error:
+            raise ValueError(f"Could not write row {row_number + 1}, column {col + 1} of {file_path} (XlsxWriter error {error}).")
+
+def discard_workbook(wb, output_file):
+    """
+    Releases a workbook that failed part-way and removes the partial file.
+    In constant_memory mode each worksheet keeps a temporary file open that only close() removes.
+
+    Args:
+        wb (xlsxwriter.Workbook): The workbook to discard.
+        output_file (str): The path the workbook was being written to.
     """
-    for attempt in range(retries):
+    try:
+        wb.close()
+    except Exception as e:
+        log_message(f"Could not close partial workbook {output_file}: {e}")
+    if os.path.exists(output_file):
+        os.remove(output_file)
+
+def skip_rows(batches, count):
+    """
+    Drops the first rows of a batch stream, used to resume a conversion.
+    Emitted rows are counted rather than file lines, so blank lines and quoted line breaks cannot shift the resume point.
+
+    Args:
+        batches (iterable): The record batches to read from.
+        count (int): The number of rows to drop.
+
+    Yields:
+        pyarrow.RecordBatch: The remaining batches.
+    """
+    for batch in batches:
+        if count >= batch.num_rows:
+            count -= batch.num_rows
+            continue
+        if count:
+            batch = batch.slice(count)
+            count = 0
+        yield batch
+
+def read_ahead(reader, depth=2):
+    """
+    Iterates over the batches of a CSV reader while a background thread reads the next ones.
+    Arrow releases the GIL while reading and parsing, so disk reads overlap with writing rows.
+
+    Args:
+        reader (pyarrow.csv.CSVStreamingReader): The reader to iterate.
+        depth (int): The number of batches read ahead of the consumer.
+
+    Yields:
+        pyarrow.RecordBatch: The next batch of rows. Errors raised by the reader are re-raised here.
+    """
+    batches = queue.Queue(maxsize=depth)
+    finished = object()
+    stopped = threading.Event()
+
+    def put(item):
+        # Time out periodically so the thread exits if the consumer stops early
+        while not stopped.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
         try:
-            return func(*args, **kwargs)
-        except MemoryError:
-            log_message(f"MemoryError encountered. Reducing chunk size for retry ({kwargs.get('chunk_size') // 2}).")
-            kwargs['chunk_size'] = max(kwargs.get('chunk_size') // 2, 500)
-    raise MemoryError("Exceeded retry limit for memory errors.")
+            for batch in reader:
+                if not put(batch):
+                    return
+            put(finished)
+        except BaseException as e:
+            put(e)
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = batches.get()
+            if item is finished:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stopped.set()
 
 def convert_csv_to_excel(file_path, output_dir, initial_chunk_size, retry_attempts=3):
     """
@@ -157,6 +565,9 @@ def convert_csv_to_excel(file_path, output_dir, initial_chunk_size, retry_attemp
         output_dir (str): The directory to save the Excel file.
         initial_chunk_size (int): Initial chunk size for processing.
         retry_attempts (int): Number of retry attempts allowed for MemoryError.
+
+    Returns:
+        tuple: (file_path, output_file, success, elapsed seconds, error message or None).
     """
     start_time = datetime.now()
     base_name = os.path.basename(file_path)
@@ -165,101 +576,275 @@ def convert_csv_to_excel(file_path, output_dir, initial_chunk_size, retry_attemp
 
     def process_file(chunk_size):
         """
-        Inner function to process the CSV file with the given chunk size.
+        Inner function to process the CSV file, starting with the given chunk size.
+        On a MemoryError the chunk size is halved and reading resumes after the last written row.
+        If Arrow rejects a row with too few fields, reading resumes there with read_padded_batches.
 
         Args:
-            chunk_size (int): Number of rows to process at a time.
+            chunk_size (int): Initial chunk size for processing.
 
         Returns:
-            bool: True if the file was successfully processed, False otherwise.
+            bool: True if the file was successfully processed, False if it failed validation.
+
+        Raises:
+            RuntimeError: If the retry limit for memory errors is exceeded.
         """
+        delimiter, columns = inspect_csv(file_path)
+        if not columns:
+            log_message(f"Validation failed: File {file_path} is empty, has no columns or could not be parsed.")
+            return False
+
+        wb = Workbook(output_file, WORKBOOK_OPTIONS)
+        saved = False
         try:
-            delimiter = determine_delimiter(file_path)
-            if not validate_csv_file(file_path, delimiter):
-                processing_stats["failure_count"] += 1
-                processing_stats["errors"][file_path] = "Validation failed"
-                return False
-
-            with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-                for i, chunk in enumerate(pd.read_csv(file_path, delimiter=delimiter, chunksize=chunk_size, dtype=str)):
-                    # Replace 'nan' and 'NAN' values with an empty string
-                    chunk.replace(['nan', 'NAN'], '', inplace=True, regex=False)
-
-                    # Fix the downcasting warning explicitly
-                    chunk = chunk.infer_objects()
-
-                    # Convert all values to strings using apply
-                    chunk = chunk.applymap(str)
-
-                    # Write to Excel
-                    chunk.to_excel(writer, index=False, header=(i == 0))
-                    
-                    # Cleanup memory
-                    del chunk
-                    gc.collect()
-            return True
-        except Exception as e:
-            raise e  # Let the retry logic handle MemoryError or other exceptions.
+            ws = wb.add_worksheet()
+            if ws.write_row(0, 0, columns):
+                write_cells(ws, 0, columns, file_path)
+            row_index = 1  # Rows must be written strictly in order in constant_memory mode
+            rows_done = 0  # CSV rows fully written so far; a retry resumes after these
+            numeric_columns = None  # Decided from the first batch and kept for the rest of the file
+            # Bind write_row once so the hot loop skips the repeated attribute lookup
+            write_row = ws.write_row
+            debug_enabled = logging.getLogger().isEnabledFor(logging.DEBUG)  # Skip building progress messages otherwise
+            pad_rows = False  # Set once Arrow rejects a short row
+            attempt = 0
+            while attempt < retry_attempts:
+                # Chunks hold no reference cycles, so keep generational sweeps out of the row loop
+                gc.disable()
+                try:
+                    if pad_rows:
+                        reader = read_padded_batches(file_path, delimiter, columns, chunk_size)
+                    else:
+                        # Arrow parses each block on multiple threads
+                        reader = open_csv_reader(file_path, delimiter, columns, block_size=chunk_size * 1024)
+                    for batch in skip_rows(read_ahead(reader), rows_done):
+                        # Blank out nan markers column by column with Arrow's vectorized kernels
+                        batch = pa.RecordBatch.from_arrays(
+                            [pc.if_else(pc.is_in(column, value_set=NAN_VALUES), '', column) for column in batch.columns],
+                            schema=batch.schema
+                        )
+                        if numeric_columns is None:
+                            numeric_columns = find_numeric_columns(batch)
+                        while batch.num_rows:
+                            # Continue on a new sheet, with the header repeated, once Excel's row limit is reached
+                            if row_index == EXCEL_MAX_ROWS:
+                                ws = wb.add_worksheet()
+                                write_row = ws.write_row
+                                if write_row(0, 0, columns):
+                                    write_cells(ws, 0, columns, file_path)
+                                row_index = 1
+                                log_message(f"Row limit reached, continuing {file_path} on {ws.name}.")
+
+                            # Zero-copy slices keep each part within the current sheet
+                            part = batch.slice(0, EXCEL_MAX_ROWS - row_index)
+                            batch = batch.slice(part.num_rows)
+
+                            # Rows are zipped straight from the Arrow columns, no DataFrame in between
+                            rows = zip(*(column_values(column, numeric) for column, numeric in zip(part.columns, numeric_columns)))
+                            for row in rows:
+                                # A non-zero result means a cell was truncated or refused; finish the row cell by cell
+                                if write_row(row_index, 0, row):
+                                    write_cells(ws, row_index, row, file_path)
+                                # Counted per row: constant_memory refuses rows behind the last one, so a retry
+                                # must resume exactly at the row that was interrupted
+                                row_index += 1
+                                rows_done += 1
+                        if debug_enabled:
+                            logging.debug(f"Wrote {row_index} rows to {ws.name} of {output_file}")
+                    break
+                except MemoryError:
+                    attempt += 1
+                    chunk_size = max(chunk_size // 2, 500)
+                    log_message(f"MemoryError: Resuming after row {rows_done} with chunk size {chunk_size} (Attempt {attempt}/{retry_attempts}).")
+                except pa.ArrowInvalid as e:
+                    # Arrow cannot pad short rows the way pandas did, so switch readers; this is not a retry
+                    if pad_rows or COLUMN_COUNT_ERROR not in str(e):
+                        raise
+                    pad_rows = True
+                    log_message(f"Short row in {file_path} ({e}), padding rows after row {rows_done}.")
+                finally:
+                    gc.enable()
+            else:
+                raise RuntimeError(f"Exceeded retry attempts ({retry_attempts}) for memory errors")
+            wb.close()
+            saved = True
+        finally:
+            if not saved:
+                discard_workbook(wb, output_file)  # Drop the temp files without leaving a partial workbook behind
+        gc.collect()  # Collect once per file rather than per chunk
+        return True
 
+    success, error = False, None
+    log_message(f"Processing file: {file_path}")
     try:
-        log_message(f"Processing file: {file_path}")
-        current_chunk_size = initial_chunk_size
-        for attempt in range(retry_attempts):
-            try:
-                if process_file(current_chunk_size):
-                    log_message(f"Successfully converted and saved: {output_file}")
-                    processing_stats["success_count"] += 1
-                    break
-            except MemoryError:
-                log_message(f"MemoryError: Reducing chunk size for retry (Attempt {attempt + 1}/{retry_attempts}).")
-                current_chunk_size = max(current_chunk_size // 2, 500)
-            except Exception as e:
-                log_message(f"Error processing file {file_path}: {e}")
-                processing_stats["failure_count"] += 1
-                processing_stats["errors"][file_path] = str(e)
-                break
+        if process_file(initial_chunk_size):
+            log_message(f"Successfully converted and saved: {output_file}")
+            success = True
         else:
-            log_message(f"Failed to process {file_path} after {retry_attempts} attempts.")
-            processing_stats["failure_count"] += 1
-            processing_stats["errors"][file_path] = "Exceeded retry attempts"
-    finally:
-        processing_stats["time_per_file"][file_path] = (datetime.now() - start_time).total_seconds()
+            error = "Validation failed"
+    except Exception as e:
+        error = str(e) or type(e).__name__  # A bare MemoryError has an empty message
+        log_message(f"Error processing file {file_path}: {error}")
+    return file_path, output_file, success, (datetime.now() - start_time).total_seconds(), error
+
+def get_file_fingerprint(file_path):
+    """
+    Computes a cheap fingerprint of a CSV file from its size, modification time
+    and the first 64 KB of its contents.
+
+    Args:
+        file_path (str): The path to the CSV file.
+
+    Returns:
+        str: The fingerprint as a hex string, or None if the file cannot be read.
+    """
+    try:
+        stat = os.stat(file_path)
+        fingerprint = hashlib.blake2b(digest_size=8)
+        fingerprint.update(f"{stat.st_size}|{stat.st_mtime_ns}".encode())
+        with open(file_path, 'rb') as file:
+            fingerprint.update(file.read(65536))
+        return fingerprint.hexdigest()
+    except OSError as e:
+        log_message(f"Could not fingerprint file {file_path}: {e}")
+        return None
+
+def load_manifest(output_dir):
+    """
+    Loads the manifest of previously converted files.
+
+    Args:
+        output_dir (str): The directory holding the manifest and the Excel files.
+
+    Returns:
+        dict: Maps absolute CSV paths to {"fingerprint": ..., "output": ...} entries.
+    """
+    manifest_file = os.path.join(output_dir, MANIFEST_FILE_NAME)
+    try:
+        with open(manifest_file, 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        log_message(f"Ignoring unreadable manifest {manifest_file}: {e}")
+        return {}
+
+def save_manifest(output_dir, manifest):
+    """
+    Saves the manifest of converted files, replacing the previous one atomically.
+
+    Args:
+        output_dir (str): The directory holding the manifest and the Excel files.
+        manifest (dict): Maps absolute CSV paths to {"fingerprint": ..., "output": ...} entries.
+    """
+    manifest_file = os.path.join(output_dir, MANIFEST_FILE_NAME)
+    with open(manifest_file + ".tmp", 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(manifest_file + ".tmp", manifest_file)
+
+def iter_csv_files(base_dir, prefix):
+    """
+    Yields the CSV files under base_dir whose names start with prefix.
+    Uses os.scandir directly so the file type cached on each entry avoids an extra stat call.
+
+    Args:
+        base_dir (str): The directory to search recursively.
+        prefix (str): The prefix the file names must start with.
 
-def process_all_csv_files(base_dir, chunk_size, max_workers):
+    Yields:
+        str: The path to each matching CSV file.
+    """
+    stack = [base_dir]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.startswith(prefix) and entry.name[-4:].lower() == '.csv' and entry.is_file():
+                        yield entry.path
+        except OSError as e:
+            log_message(f"Skipping directory {directory}: {e}")
+
+def process_all_csv_files(base_dir, chunk_size, max_workers, storage_type):
     """
     Processes all CSV files in the directory and subdirectories.
 
     Args:
         base_dir (str): The base directory containing CSV files.
         chunk_size (int): Initial chunk size for processing.
-        max_workers (int): Number of parallel threads to use.
+        max_workers (int): Maximum number of worker processes to use.
+        storage_type (str): The storage type of base_dir, as returned by get_storage_type.
     """
     output_dir = create_output_directory(base_dir)
     setup_logging(output_dir)
 
-    csv_files = [
-        os.path.join(root, file)
-        for root, _, files in os.walk(base_dir)
-        for file in files
-        if file.startswith(FILE_PREFIX) and file.lower().endswith('.csv')
-    ]
+    csv_files = list(iter_csv_files(base_dir, FILE_PREFIX))
 
     processing_stats["total_files"] = len(csv_files)
     log_message(f"Found {len(csv_files)} files to process.")
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_file = {
-            executor.submit(convert_csv_to_excel, file_path, output_dir, chunk_size): file_path
-            for file_path in tqdm(csv_files, desc="Submitting files", unit="file")
-        }
-        for future in tqdm(as_completed(future_to_file), total=len(future_to_file), desc="Processing files", unit="file"):
-            try:
-                future.result()
-            except Exception as e:
+    # Skip files whose fingerprint matches an earlier conversion that still exists
+    manifest = load_manifest(output_dir)
+    file_fingerprints = {}
+    for file_path in csv_files:
+        fingerprint = get_file_fingerprint(file_path)
+        entry = manifest.get(os.path.abspath(file_path))
+        if fingerprint and entry and entry.get("fingerprint") == fingerprint and os.path.exists(entry.get("output", "")):
+            log_message(f"Skipping unchanged file {file_path}, already converted to {entry['output']}")
+            processing_stats["skipped_count"] += 1
+        else:
+            file_fingerprints[file_path] = fingerprint
+    pending_files = list(file_fingerprints)
+
+    if not pending_files:
+        return
+
+    max_workers = min(max_workers, len(pending_files))
+
+    # Warm the page cache for the files queued behind the ones being converted. Only on SSDs:
+    # on spinning disks it brings back seek thrashing, and on network shares it doubles the transfer
+    prefetch_slots = threading.Semaphore(max_workers * 2)
+    if storage_type == 'ssd':
+        threading.Thread(target=prefetch_files, args=(pending_files, prefetch_slots), daemon=True).start()
+
+    # Workers send log records to the parent, which writes them through its own handlers
+    log_queue = multiprocessing.Queue(-1)
+    listener = QueueListener(log_queue, *logging.getLogger().handlers)
+    listener.start()
+
+    try:
+        # Conversion is CPU-bound, so worker processes sidestep the GIL; stats are aggregated here
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 initializer=setup_worker_logging, initargs=(log_queue,)) as executor:
+            future_to_file = {
+                executor.submit(convert_csv_to_excel, file_path, output_dir, chunk_size): file_path
+                for file_path in tqdm(pending_files, desc="Submitting files", unit="file")
+            }
+            for future in tqdm(as_completed(future_to_file), total=len(future_to_file), desc="Processing files", unit="file"):
                 file_path = future_to_file[future]
-                log_message(f"Error processing file {file_path}: {e}")
-                processing_stats["failure_count"] += 1
-                processing_stats["errors"][file_path] = str(e)
+                prefetch_slots.release()
+                try:
+                    _, output_file, success, elapsed, error = future.result()
+                    processing_stats["time_per_file"][file_path] = elapsed
+                except Exception as e:
+                    log_message(f"Error processing file {file_path}: {e}")
+                    success, error = False, str(e)
+                if success:
+                    processing_stats["success_count"] += 1
+                    if file_fingerprints[file_path] is not None:
+                        # Keyed by path, so a re-converted file replaces its previous entry
+                        manifest[os.path.abspath(file_path)] = {"fingerprint": file_fingerprints[file_path], "output": output_file}
+                else:
+                    processing_stats["failure_count"] += 1
+                    processing_stats["errors"][file_path] = error
+    finally:
+        try:
+            # Keep the conversions that finished even if the run is interrupted
+            save_manifest(output_dir, manifest)
+        finally:
+            listener.stop()
 
 def display_summary():
     """
@@ -269,6 +854,7 @@ def display_summary():
     log_message(f"Total files processed: {processing_stats['total_files']}")
     log_message(f"Successful conversions: {processing_stats['success_count']}")
     log_message(f"Failed conversions: {processing_stats['failure_count']}")
+    log_message(f"Skipped (already converted): {processing_stats['skipped_count']}")
     for file, error in processing_stats["errors"].items():
         log_message(f"  - Failed file: {file}, Error: {error}")
     for file, time_taken in processing_stats["time_per_file"].items():
@@ -282,8 +868,15 @@ if __name__ == "__main__":
         setup_logging(output_dir)
         log_message("Script execution started.")
 
+        # Read system memory once; it only sizes the chunks at startup
+        memory_info = psutil.virtual_memory()
+
+        # Detect the storage once; it decides both the worker count and whether files are prefetched
+        storage_type = get_storage_type(BASE_DIRECTORY)
+        log_message(f"Detected {storage_type} storage for {BASE_DIRECTORY}.")
+
         # Proceed with processing
-        process_all_csv_files(BASE_DIRECTORY, get_dynamic_chunk_size(), os.cpu_count())
+        process_all_csv_files(BASE_DIRECTORY, get_dynamic_chunk_size(memory_info), get_max_workers(storage_type), storage_type)
     except Exception as e:
         log_message(f"Critical error during execution: {e}")
         traceback.print_exc()